@@ -1,6 +1,9 @@
 # Core logic for Columns Game
 
+import mmap
+import os
 import random
+import re
 from collections import namedtuple
 
 # includes empty color (0), and the rest of the colors (1-7)
@@ -8,6 +11,8 @@ TOTAL_COLORS = 8
 # consists of 3 jewels
 FALLER_LENGTH = 3
 MIN_MATCH_LENGTH = 3
+# points for each matched jewel, multiplied by the cascade step
+POINTS_PER_JEWEL = 10
 
 FROZEN_STATE = 0
 FALLING_STATE = 1
@@ -17,8 +22,14 @@ MATCHED_STATE = 3
 MIN_ROWS = 4
 MIN_COLS = 3
 
+# (row, col) steps of horizontal, vertical and both diagonal matches
+_MATCH_DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
 
 Position = namedtuple('Position', 'row col')
+BoardResult = namedtuple('BoardResult', 'index cascades score')
+CellChange = namedtuple('CellChange',
+                        'position old_color old_state new_color new_state')
 
 
 class GameRuleError(Exception):
@@ -33,18 +44,20 @@ class GameOver(Exception):
 # ------------ JEWEL CLASS ----------- #
 
 class Jewel:
+    __slots__ = ('_color', '_state')
+
     def __init__(self, color = 0, state = 0):
         self._color = color
         self._state = state
         
 
     def __eq__(self, jewel) -> bool:
-        return self._color == jewel.color()
+        return self._color == jewel._color
 
 
     def matches(self, jewel) -> bool:
-        return (self._color == jewel.color() and
-                self._state == jewel.state())
+        return (self._color == jewel._color and
+                self._state == jewel._state)
 
 
     def set_color(self, color: int) -> None:
@@ -71,6 +84,21 @@ class Jewel:
         return self._state
 
 
+class _EmptyJewel(Jewel):
+    '''The empty jewel, one instance is shared by every empty cell'''
+    __slots__ = ()
+
+    def set_color(self, color: int) -> None:
+        raise GameRuleError('Cannot modify the shared empty jewel')
+
+
+    def set_state(self, state: int) -> None:
+        raise GameRuleError('Cannot modify the shared empty jewel')
+
+
+EMPTY_JEWEL = _EmptyJewel()
+
+
 
 # ------------ FALLER CLASS ----------- #
 
@@ -87,21 +115,29 @@ class Faller:
             for i in jewels:
                 self._jewels.append(Jewel(i, FALLING_STATE))
 
+        # how many times the faller has been rotated, the jewels
+        # themselves never move within self._jewels
+        self._offset = 0
+
 
     def __eq__(self, faller) -> bool:
-        return self._jewels == faller.jewels()
+        return self.jewels() == faller.jewels()
 
 
     def rotate(self) -> None:
-        rotated_jewels = []
-        for i in range(len(self._jewels)):
-            rotated_jewels.append(self._jewels[(i - 1) % FALLER_LENGTH])
+        self._offset = (self._offset + 1) % FALLER_LENGTH
+
 
-        self._jewels = rotated_jewels
+    def jewel(self, index: int) -> Jewel:
+        '''Returns the jewel at index, counting from the top of the faller'''
+        return self._jewels[(index - self._offset) % FALLER_LENGTH]
 
 
     def jewels(self) -> list[Jewel]:
-        return self._jewels
+        jewels = []
+        for i in range(FALLER_LENGTH):
+            jewels.append(self.jewel(i))
+        return jewels
 
 
     def fall(self) -> None:
@@ -133,9 +169,12 @@ class Field:
         for i in range(rows + FALLER_LENGTH - 1):
             row = []
             for j in range(cols):
-                row.append(Jewel())
+                row.append(EMPTY_JEWEL)
             self._cells.append(row)
 
+        # list of CellChange, is None when changes are not recorded
+        self._changes = None
+
 
     def fill(self, contents: list[list[int]]) -> None:
         '''Fills cells with contents, applies gravity'''
@@ -145,7 +184,44 @@ class Field:
                 row_from_gravity += self.count_empty_spaces_underneath(
                     Position(i, j))
                 cell = self._cells[row_from_gravity + FALLER_LENGTH - 1][j]
-                cell.set_color(contents[i][j])
+                if contents[i][j] == 0:
+                    self.put_cell(row_from_gravity, j, EMPTY_JEWEL)
+                else:
+                    self.put_cell(row_from_gravity, j,
+                                  Jewel(contents[i][j], cell.state()))
+
+
+    def record_changes(self) -> None:
+        '''Starts recording every change made to the cells'''
+        if self._changes is None:
+            self._changes = []
+
+
+    def record_change(self, row: int, col: int, old_color: int,
+                      old_state: int, jewel: Jewel) -> None:
+        '''Records that the cell at (row, col) went from
+        old_color/old_state to the current color/state of jewel'''
+        if self._changes is not None:
+            self._changes.append(CellChange(Position(row, col),
+                                            old_color, old_state,
+                                            jewel.color(), jewel.state()))
+
+
+    def take_changes(self) -> list[CellChange]:
+        '''Returns the changes recorded so far and starts a new list'''
+        changes = self._changes
+        if changes is None:
+            return []
+        self._changes = []
+        return changes
+
+
+    def is_empty_below(self, row: int, col: int) -> bool:
+        '''Checks if there is an empty space right under (row, col)'''
+        below = row + FALLER_LENGTH
+        return (below < len(self._cells)
+                and self._cells[below][col].color() == 0)
+
 
     def count_empty_spaces_underneath(self, pos: Position) -> int:
         '''Counts how many empty spaces are underneath a certain position
@@ -176,7 +252,16 @@ class Field:
 
 
     def set_cell(self, pos: Position, jewel: Jewel) -> None:
-        self._cells[pos.row + (FALLER_LENGTH - 1)][pos.col] = jewel
+        self.put_cell(pos.row, pos.col, jewel)
+
+
+    def put_cell(self, row: int, col: int, jewel: Jewel) -> None:
+        '''Same as set_cell, without needing a Position'''
+        cells_row = self._cells[row + (FALLER_LENGTH - 1)]
+        if self._changes is not None:
+            old = cells_row[col]
+            self.record_change(row, col, old.color(), old.state(), jewel)
+        cells_row[col] = jewel
 
 
     def set_cells(self, jewel_positions: [(Position, Jewel)]) -> None:
@@ -226,21 +311,27 @@ class Field:
 
 
     def is_empty_space(self, pos: Position) -> bool:
-        return self._cells[pos.row + FALLER_LENGTH - 1][pos.col] == Jewel(0)
+        return self._cells[pos.row + FALLER_LENGTH - 1][pos.col].color() == 0
+
+
+    def is_empty_at(self, row: int, col: int) -> bool:
+        '''Same as is_empty_space, without needing a Position'''
+        return self._cells[row + FALLER_LENGTH - 1][col].color() == 0
 
 
     def apply_gravity(self) -> None:
-        '''Fills in holes under cells'''
-        for i in reversed(range(len(self._cells))):
-            for j in range(len(self._cells[i])):
+        '''Fills in holes under cells, one pass per column'''
+        for j in range(self.cols()):
+            landing_row = len(self._cells) - 1
+            for i in reversed(range(len(self._cells))):
                 jewel = self._cells[i][j]
-                pos = Position(i - (FALLER_LENGTH - 1), j)
-                row_from_gravity = i
-                empty_spaces = self.count_empty_spaces_underneath(pos)
-                row_from_gravity += empty_spaces
-                if empty_spaces > 0:
-                    self._cells[row_from_gravity][j] = jewel
-                    self._cells[i][j] = Jewel(0)
+                if jewel.color() != 0:
+                    if landing_row != i:
+                        self.put_cell(landing_row - (FALLER_LENGTH - 1), j,
+                                      jewel)
+                        self.put_cell(i - (FALLER_LENGTH - 1), j,
+                                      EMPTY_JEWEL)
+                    landing_row -= 1
         
                 
     
@@ -249,23 +340,42 @@ class Field:
 # ------------ GAME STATE CLASS ----------- #
 
 class GameState:
-    def __init__(self, rows: int, cols: int):
+    def __init__(self, rows: int, cols: int,
+                 match_length: int = MIN_MATCH_LENGTH):
         if (type(rows) == int and type(cols) == int
-            and rows >= MIN_ROWS and cols >= MIN_COLS):
+            and type(match_length) == int
+            and rows >= MIN_ROWS and cols >= MIN_COLS
+            and match_length > 1):
             pass
         else:
             raise GameRuleError()
 
+        # how many aligned jewels of the same color make a match
+        self._match_length = match_length
+
         # Invisible rows included in Field class
         # don't need to worry about it here
         self._field = Field(rows, cols)
 
         self._faller = Faller()
         self._game_over = False
+        self._observers = []
+
+        # Scoring, updated as jewels get matched.
+        # chain is the cascade step of the current search for matches:
+        # 1 for the matches a faller makes, 2 for the ones made once those
+        # are eliminated, and so on
+        self._score = 0
+        self._chain = 1
+        self._longest_chain = 0
+        # matched jewels of each color, indexed by color
+        self._matched_by_color = [0] * TOTAL_COLORS
 
-        # position of the last jewel in the faller
-        # is None when faller is not falling
-        self._faller_position = None # starts off at 0 (so top jewel is at -2)
+        # row and col of the last jewel in the faller, kept as plain ints
+        # so moving the faller does not build a Position every time
+        # row is None when faller is not falling
+        self._faller_row = None # starts off at 0 (so top jewel is at -2)
+        self._faller_col = None
 
 
     def fill_field(self, contents: list[list[int]]) -> None:
@@ -291,20 +401,97 @@ class GameState:
             raise GameRuleError('Invalid parameters to fill field')
                 
         self._field.fill(contents)
+        self._chain = 1
         self.search_for_matches()
 
 
+    def resolve_cascades(self) -> list[int]:
+        '''Eliminates matches and applies gravity until the field settles,
+        returns how many jewels were cleared at each cascade step'''
+        cascades = []
+        while True:
+            cleared = self.eliminate_matches()
+            if cleared == 0:
+                return cascades
+            cascades.append(cleared)
+            self._field.apply_gravity()
+            self._chain += 1
+            self.search_for_matches()
+
+
+    def score(self) -> int:
+        return self._score
+
+
+    def chain(self) -> int:
+        '''Returns the cascade step of the latest matches'''
+        return self._chain
+
+
+    def longest_chain(self) -> int:
+        return self._longest_chain
+
+
+    def matched_by_color(self) -> list[int]:
+        '''Returns how many jewels of each color got matched,
+        indexed by color'''
+        return list(self._matched_by_color)
+
+
+    def reset_score(self) -> None:
+        self._score = 0
+        self._chain = 1
+        self._longest_chain = 0
+        self._matched_by_color = [0] * TOTAL_COLORS
+
+
     def field(self) -> Field:
         return self._field
 
 
+    def subscribe(self, observer) -> None:
+        '''Registers observer(changes) to be called with the cell changes
+        every time they are flushed, and starts recording them'''
+        self._field.record_changes()
+        self._observers.append(observer)
+
+
+    def flush_changes(self) -> list[CellChange]:
+        '''Returns the cell changes since the last flush (one per cell,
+        cells that ended up unchanged are left out) and passes them
+        on to every observer. Meant to be called once per tick'''
+        merged = {}
+        for change in self._field.take_changes():
+            first = merged.get(change.position)
+            if first is None:
+                merged[change.position] = change
+            else:
+                merged[change.position] = first._replace(
+                    new_color = change.new_color,
+                    new_state = change.new_state)
+
+        changes = []
+        for change in merged.values():
+            if (change.old_color != change.new_color
+                or change.old_state != change.new_state):
+                changes.append(change)
+
+        for observer in self._observers:
+            observer(changes)
+        return changes
+
+
     def handle_time(self) -> None:
         '''Handles the passage of time (e.g., moving the faller down, etc.)
         1 tick = user input (whether it's a blank line or a command)'''
-        if self._faller_position != None:
+        if self._faller_row != None:
             self.move_faller_down()
         else:
-            self.eliminate_matches()
+            if self.eliminate_matches() > 0:
+                # matches made now come from the jewels that fell
+                self._chain += 1
+            else:
+                self._chain = 1
             self._field.apply_gravity()
             self.search_for_matches()
             if not self.check_if_faller_fits():
@@ -315,31 +502,25 @@ class GameState:
     def move_faller_down(self) -> None:
         '''Checks if it is a valid move to have the faller move downwards,
         then moves the faller one column downwards for each of its jewels'''
-        empty_spaces = self._field.count_empty_spaces_underneath(
-            self._faller_position)
-        if empty_spaces > 0:
-            col = self._faller_position.col
-            top_row = self._faller_position.row - (FALLER_LENGTH - 1)
-            jewel_index = FALLER_LENGTH - 1
-            for row in reversed(range(top_row, top_row + FALLER_LENGTH)):
-                jewel = self._faller.jewels()[jewel_index]
-                jewel_index -= 1
-                
-                self._field.set_cell(Position(row + 1, col), jewel)
-                if row == top_row:
-                    self._field.set_cell(Position(row, col), Jewel(0, 0))
-                    
-            self._faller_position = Position(self._faller_position.row + 1,
-                                             self._faller_position.col)
+        row = self._faller_row
+        col = self._faller_col
+        if self._field.is_empty_below(row, col):
+            for i in range(FALLER_LENGTH):
+                self._field.put_cell(row + 1 - i, col,
+                                     self._faller.jewel(FALLER_LENGTH - 1 - i))
+            self._field.put_cell(row + 1 - FALLER_LENGTH, col, EMPTY_JEWEL)
+            self._faller_row = row + 1
 
             # check position again to see if it has landed
             self.check_faller_landing()
         else:
             self._faller.freeze()
+            self._record_faller_state(LANDED_STATE)
+            self._chain = 1
             self.search_for_matches()
             if not self.check_if_faller_fits():
                 raise GameOver()
-            self._faller_position = None
+            self._faller_row = None
 
 
     def check_if_faller_fits(self) -> bool:
@@ -361,91 +542,105 @@ class GameState:
     def check_faller_landing(self) -> bool:
         '''Lands/Unlands the faller if there is a jewel/space under it
         and returns if it got landed/unlanded'''
-        empty_spaces = self._field.count_empty_spaces_underneath(
-            self._faller_position)
-        if empty_spaces <= 0:
+        if not self._field.is_empty_below(self._faller_row, self._faller_col):
             if self._faller.state() == FALLING_STATE:
                 self._faller.land()
+                self._record_faller_state(FALLING_STATE)
             return True
         else:
             if self._faller.state() == LANDED_STATE:
                 self._faller.fall()
+                self._record_faller_state(LANDED_STATE)
             return False
 
 
+    def _record_faller_state(self, old_state: int) -> None:
+        '''Records the state change of every faller jewel on the field'''
+        row = self._faller_row
+        for i in reversed(range(FALLER_LENGTH)):
+            jewel = self._faller.jewel(i)
+            self._field.record_change(row, self._faller_col, jewel.color(),
+                                      old_state, jewel)
+            row -= 1
+
+
     def current_faller(self) -> Faller:
         return self._faller
 
 
     def update_faller(self, jewels: list[int] = []) -> None:
-        if self._faller_position != None:
+        if self._faller_row != None:
             raise GameRuleError('Cannot update a faller already on the field')
             
         self._faller = Faller(jewels)
 
 
     def drop_faller(self, col: int) -> None:
-        if self._faller_position != None:
+        if self._faller_row != None:
             raise GameRuleError('Cannot drop a faller already on the field')
 
         if col < 1 or col > self._field.cols():
             raise GameRuleError('Invalid Column to Drop Faller')
 
-        if self._field.get_cell(Position(0, col - 1)) != Jewel(0):
+        if not self._field.is_empty_at(0, col - 1):
             raise GameOver()
 
-        
-        index = 0
-        for jewel in self._faller.jewels():
-            position = Position(index - (FALLER_LENGTH - 1), col - 1)
-            self._field.set_cell(position, jewel)
-            self._faller_position = position
-            index += 1
+        for i in range(FALLER_LENGTH):
+            self._field.put_cell(i - (FALLER_LENGTH - 1), col - 1,
+                                 self._faller.jewel(i))
+        self._faller_row = 0
+        self._faller_col = col - 1
 
         self.check_faller_landing()
         
 
     def rotate_faller(self) -> None:
         self._faller.rotate()
-        current_row = self._faller_position.row
-        col = self._faller_position.col
-        for jewel in reversed(self._faller.jewels()):
-            self._field.set_cell(Position(current_row, col), jewel)
-            current_row -= 1
+        row = self._faller_row
+        for i in reversed(range(FALLER_LENGTH)):
+            self._field.put_cell(row, self._faller_col, self._faller.jewel(i))
+            row -= 1
     
 
     def move_faller_column(self, direction: int) -> None:
         '''Moves the faller left or right, depending on the direction'''
-        row = self._faller_position.row
-        col = self._faller_position.col
-        
+        row = self._faller_row
+        col = self._faller_col
+        new_col = col + direction
+
         # first check:
-        for jewel in reversed(self._faller.jewels()):
-            position = Position(row, col + direction)
-            
-            if not (self._field.is_valid_space(position) and
-                self._field.is_empty_space(position)):
-                # either not valid space to move or there is an
-                # existing jewel in that space
+        if new_col < 0 or new_col >= self._field.cols():
+            return
+        for i in range(FALLER_LENGTH):
+            if not self._field.is_empty_at(row - i, new_col):
+                # there is an existing jewel in that space
                 return
-            row -= 1
 
-        row = self._faller_position.row
-        for jewel in reversed(self._faller.jewels()):
-            position = Position(row, col + direction)
-            self._field.set_cell(position, jewel)
-            self._field.set_cell(Position(row, col), Jewel(0))
-            row -= 1
+        for i in range(FALLER_LENGTH):
+            self._field.put_cell(row - i, new_col,
+                                 self._faller.jewel(FALLER_LENGTH - 1 - i))
+            self._field.put_cell(row - i, col, EMPTY_JEWEL)
 
-        self._faller_position = Position(self._faller_position.row,
-                                         col + direction)
+        self._faller_col = new_col
 
         self.check_faller_landing()
 
 
 
     def get_faller_position(self) -> Position:
-        return self._faller_position
+        if self._faller_row == None:
+            return None
+        return Position(self._faller_row, self._faller_col)
+
+
+    def faller_row(self) -> int:
+        '''Returns the row of the last jewel in the faller, None when the
+        faller is not falling. Unlike get_faller_position, builds nothing'''
+        return self._faller_row
+
+
+    def faller_col(self) -> int:
+        return self._faller_col
 
 
     
@@ -462,75 +657,92 @@ class GameState:
         return jewel_positions
     
 
-    def search_for_matches(self) -> None:
+    def search_for_matches(self) -> int:
         '''Searches for matches of every jewel type and sets the state
-        of all the jewels with a match as MATCHED_STATE'''
-        for color in range(1, TOTAL_COLORS):
-            jewel_positions = self.get_all_jewels_of(color)
-            count = 1
-            for position, jewel in jewel_positions:
-                if count >= len(jewel_positions):
-                    break
-                start = count
-
-                # horizontal delta
-                matches = self.get_matches_for_delta(
-                    (0, 1), jewel_positions[start:],
-                    (position, jewel)
-                    )
-
-                matches = self.get_matches_for_delta(
-                    (0, -1), jewel_positions[start:],
-                    (position, jewel)
-                    )
-
-                # vertical delta
-                matches = self.get_matches_for_delta(
-                    (1, 0), jewel_positions[start:],
-                    (position, jewel)
-                    )
-
-                matches = self.get_matches_for_delta(
-                    (-1, 0), jewel_positions[start:],
-                    (position, jewel)
-                    )
-
-                # diagonal delta
-                matches = self.get_matches_for_delta(
-                    (1, 1), jewel_positions[start:],
-                    (position, jewel)
-                    )
-
-                matches = self.get_matches_for_delta(
-                    (1, -1), jewel_positions[start:],
-                    (position, jewel)
-                    )
+        of all the jewels with a match as MATCHED_STATE, scoring them
+        as they get marked. Returns how many jewels got newly matched.
+        Each line of same colored jewels is walked once from its first
+        jewel, so the search is linear in the number of cells'''
+        matched = 0
+        cells = self._field.cells()
+        rows = len(cells)
+        cols = len(cells[0])
+        for d_row, d_col in _MATCH_DIRECTIONS:
+            for i in range(rows):
+                for j in range(cols):
+                    color = cells[i][j].color()
+                    if color == 0:
+                        continue
+
+                    # skip jewels that continue a line already walked
+                    prev_i = i - d_row
+                    prev_j = j - d_col
+                    if (0 <= prev_i < rows and 0 <= prev_j < cols
+                        and cells[prev_i][prev_j].color() == color):
+                        continue
+
+                    length = 1
+                    next_i = i + d_row
+                    next_j = j + d_col
+                    while (next_i < rows and 0 <= next_j < cols
+                           and cells[next_i][next_j].color() == color):
+                        length += 1
+                        next_i += d_row
+                        next_j += d_col
+
+                    if length >= self._match_length:
+                        matched += self._mark_matched(
+                            i, j, (d_row, d_col), length)
+        return matched
+
+
+    def _mark_matched(self, row: int, col: int, delta: (int, int),
+                      length: int) -> int:
+        '''Sets the state of length jewels as MATCHED_STATE, starting at
+        (row, col) of the cells (invisible rows included) and
+        following delta. Returns how many were not matched before'''
+        matched = 0
+        cells = self._field.cells()
+        d_row, d_col = delta
+        for n in range(length):
+            if self._set_matched(row, col, cells[row][col]):
+                matched += 1
+            row += d_row
+            col += d_col
+        return matched
+
+
+    def _set_matched(self, row: int, col: int, jewel: Jewel) -> bool:
+        '''Sets the state of jewel, at (row, col) of the cells, as
+        MATCHED_STATE and scores it. Returns False if it already was'''
+        old_state = jewel.state()
+        if old_state == MATCHED_STATE:
+            return False
 
-                matches = self.get_matches_for_delta(
-                    (-1, 1), jewel_positions[start:],
-                    (position, jewel)
-                    )
+        jewel.set_state(MATCHED_STATE)
+        self._field.record_change(row - (FALLER_LENGTH - 1), col,
+                                  jewel.color(), old_state, jewel)
 
-                matches = self.get_matches_for_delta(
-                    (-1, -1), jewel_positions[start:],
-                    (position, jewel)
-                    )
-                
-
-                count += 1
+        self._score += POINTS_PER_JEWEL * self._chain
+        self._matched_by_color[jewel.color()] += 1
+        if self._chain > self._longest_chain:
+            self._longest_chain = self._chain
+        return True
 
 
     def get_matches_for_delta(
         self, delta: (int, int), pos_jewels: list[(Position, Jewel)],
-        current_pos_jewel: (Position, Jewel)) -> None:
+        current_pos_jewel: (Position, Jewel)) -> list[Jewel]:
         '''Delta Inputs:
         (0, 1) -> horizontal match
         (1, 0) -> vertical match
         (1, 1) -> diagonal match
+        Returns the matched jewels, empty if there is no match
         '''
         position, jewel = current_pos_jewel
         deltas = [delta]
         aligned_jewels = [jewel]
+        aligned_positions = [position]
         previous_pos = position
         for i in range(len(pos_jewels)):
             next_pos, next_jewel = pos_jewels[i]
@@ -543,13 +755,15 @@ class GameState:
 
             if self.equals_all(deltas, delta):
                 aligned_jewels.append(next_jewel)
+                aligned_positions.append(next_pos)
                 previous_pos = next_pos
                 
-        if len(aligned_jewels) >= MIN_MATCH_LENGTH:
-            for jewel in aligned_jewels:
-                jewel.set_state(MATCHED_STATE)
+        if len(aligned_jewels) >= self._match_length:
+            for jewel, pos in zip(aligned_jewels, aligned_positions):
+                self._set_matched(pos.row, pos.col, jewel)
                 # print(self._field.get_position(jewel))
-        
+            return aligned_jewels
+        return []
 
 
     def get_delta_of_positions(self,
@@ -578,7 +792,7 @@ class GameState:
                 if delta == next_delta:
                     aligned_jewels.append(next_jewel)
             # excludes the first jewel of the match
-            if len(aligned_jewels) >= MIN_MATCH_LENGTH - 1:
+            if len(aligned_jewels) >= self._match_length - 1:
                 all_aligned_jewels.extend(aligned_jewels)
             
             start += 1
@@ -592,12 +806,17 @@ class GameState:
         return True
     
 
-    def eliminate_matches(self) -> None:
+    def eliminate_matches(self) -> int:
+        '''Empties every matched cell, returns how many were emptied'''
+        cleared = 0
         cells = self._field.cells()
         for i in range(len(cells)):
             for j in range(len(cells[i])):
                 if cells[i][j].state() == MATCHED_STATE:
-                    cells[i][j] = Jewel(0)
+                    self._field.set_cell(
+                        Position(i - (FALLER_LENGTH - 1), j), EMPTY_JEWEL)
+                    cleared += 1
+        return cleared
 
 
     def match_exists(self) -> bool:
@@ -612,3 +831,173 @@ class GameState:
 
     def game_over(self) -> bool:
         return self._game_over
+
+
+
+# ------------ BULK EVALUATION ----------- #
+
+_NPY_MAGIC = b'\x93NUMPY'
+# every byte value that is a valid color
+_VALID_COLORS = bytes(range(TOTAL_COLORS))
+BOARDS_PER_CHUNK = 4096
+
+
+class _PackedBoard:
+    '''A board kept as one color byte per cell, for evaluating many boards
+    without building a Jewel for every cell.
+    Each row is followed by an always empty padding byte, so that a line
+    of jewels that runs off one side of the board never continues on
+    the next row, and every line of cells (rows, columns and both
+    diagonals) is a plain slice of the buffer'''
+    def __init__(self, rows: int, cols: int, match_length: int):
+        self._rows = rows
+        self._cols = cols
+        self._width = cols + 1
+        self._cells = bytearray(rows * self._width)
+        self._match = re.compile(
+            b'([^\\x00])\\1{' + str(match_length - 1).encode() + b',}')
+
+        # (first cell, step) of every line a match can be made on
+        width = self._width
+        self._lines = [(0, 1)]
+        for start in range(width):
+            self._lines.append((start, width))
+        for start in range(width + 1):
+            self._lines.append((start, width + 1))
+        for start in range(width - 1):
+            self._lines.append((start, width - 1))
+
+
+    def load(self, board: bytes) -> None:
+        '''Copies a packed board (one byte per visible cell) into the
+        buffer, applies gravity'''
+        cols = self._cols
+        width = self._width
+        for i in range(self._rows):
+            self._cells[i * width:i * width + cols] = (
+                board[i * cols:(i + 1) * cols])
+        self.apply_gravity()
+
+
+    def apply_gravity(self) -> None:
+        '''Fills in holes under cells, one slice per column'''
+        for j in range(self._cols):
+            column = bytes(self._cells[j::self._width])
+            jewels = column.replace(b'\x00', b'')
+            if len(jewels) != len(column):
+                self._cells[j::self._width] = (
+                    bytes(len(column) - len(jewels)) + jewels)
+
+
+    def search_for_matches(self) -> set[int]:
+        '''Returns the indices of every cell that is part of a match'''
+        matched = set()
+        cells = self._cells
+        for start, step in self._lines:
+            for match in self._match.finditer(cells[start::step]):
+                matched.update(range(start + step * match.start(),
+                                     start + step * match.end(), step))
+        return matched
+
+
+    def resolve_cascades(self) -> (list[int], int):
+        '''Eliminates matches and applies gravity until the board settles,
+        returns how many jewels were cleared at each cascade step and
+        the score, as GameState would'''
+        cascades = []
+        score = 0
+        chain = 1
+        matched = self.search_for_matches()
+        while len(matched) > 0:
+            cascades.append(len(matched))
+            score += POINTS_PER_JEWEL * chain * len(matched)
+            for index in matched:
+                self._cells[index] = 0
+            self.apply_gravity()
+            chain += 1
+            matched = self.search_for_matches()
+        return cascades, score
+
+
+def evaluate_boards(path: str, rows: int = None, cols: int = None,
+                    match_length: int = MIN_MATCH_LENGTH):
+    '''Lazily yields a BoardResult for every board in a file: the jewels
+    cleared at each cascade step and the score they make.
+    The file is either packed binary (one byte per cell, row by row,
+    board after board; rows and cols are required) or a .npy file of
+    uint8 with shape (boards, rows, cols).
+    The file is memory mapped and validated one chunk of boards at a
+    time, so memory stays bounded no matter how many boards it holds.
+    Boards are evaluated on their bytes, without a GameState'''
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # no boards, and an empty file cannot be memory mapped
+            return
+
+        with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            start = 0
+            if data[:len(_NPY_MAGIC)] == _NPY_MAGIC:
+                start, rows, cols = _read_npy_header(data, rows, cols)
+
+            if rows is None or cols is None:
+                raise GameRuleError('Board dimensions are required')
+
+            if (type(rows) != int or type(cols) != int
+                or rows < MIN_ROWS or cols < MIN_COLS
+                or type(match_length) != int or match_length <= 1):
+                raise GameRuleError('Invalid board dimensions or match length')
+
+            board = _PackedBoard(rows, cols, match_length)
+            board_size = rows * cols
+            if (len(data) - start) % board_size != 0:
+                raise GameRuleError('File does not hold whole boards')
+
+            chunk_size = board_size * BOARDS_PER_CHUNK
+            index = 0
+            for chunk_start in range(start, len(data), chunk_size):
+                chunk = data[chunk_start:chunk_start + chunk_size]
+                # deleting all valid colors leaves only the invalid ones
+                if chunk.translate(None, _VALID_COLORS):
+                    raise GameRuleError('Invalid colors in boards')
+
+                for offset in range(0, len(chunk), board_size):
+                    board.load(chunk[offset:offset + board_size])
+                    cascades, score = board.resolve_cascades()
+                    yield BoardResult(index, cascades, score)
+                    index += 1
+
+
+def _read_npy_header(data: mmap.mmap, rows: int, cols: int) -> (int, int, int):
+    '''Parses the header of a .npy file, returns where the boards start
+    and the board dimensions'''
+    # only needed here, so importing columns stays cheap
+    import ast
+
+    try:
+        version = data[len(_NPY_MAGIC)]
+        if version == 1:
+            header_length = int.from_bytes(data[8:10], 'little')
+            header_start = 10
+        else:
+            header_length = int.from_bytes(data[8:12], 'little')
+            header_start = 12
+
+        header = ast.literal_eval(
+            data[header_start:header_start + header_length].decode('latin1'))
+        shape = header['shape']
+        descr = header['descr']
+        fortran_order = header['fortran_order']
+        shape_length = len(shape)
+    except (IndexError, KeyError, TypeError, ValueError, SyntaxError,
+            MemoryError, RecursionError):
+        raise GameRuleError('Invalid .npy header')
+
+    if (descr not in ('|u1', '<u1', '|i1')
+        or fortran_order or shape_length != 3):
+        raise GameRuleError('Boards must be uint8 with shape (n, rows, cols)')
+
+    if ((rows is not None and rows != shape[1])
+        or (cols is not None and cols != shape[2])):
+        raise GameRuleError('Board dimensions do not match the file')
+
+    return header_start + header_length, shape[1], shape[2]
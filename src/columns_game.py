@@ -5,7 +5,10 @@
 
 import pygame
 import columns
+import math
 import random
+import argparse
+import threading
 from collections import namedtuple
 
 
@@ -26,60 +29,64 @@ _FIELD_COLS = 6
 
 
 _INITIAL_WIDTH = 360
-_INITIAL_HEIGHT = _INITIAL_WIDTH * _FIELD_ROWS / _FIELD_COLS
+_MAX_INITIAL_HEIGHT = 720
+_MAX_INITIAL_SIZE = (1440, 900)
+
+# below this many pixels per cell, only part of the field is shown
+# and the view scrolls with W/A/S/D
+_MIN_CELL_LENGTH = 24
 
 _BACKGROUND_COLOR = pygame.Color(0, 34, 64)
 
+_FROZEN_BORDER = BorderStyle(pygame.Color(0, 0, 0), 1)
+_FALLING_BORDER = BorderStyle(pygame.Color(24, 24, 240), 2)
+_LANDED_BORDER = BorderStyle(pygame.Color(240, 24, 24), 3)
+_MATCHED_BORDER = BorderStyle(pygame.Color(24, 240, 24), 4)
 
-class ColumnsGame:
-    def __init__(self):
-        self._running = True
-        self._game_over = False
-        self._state = columns.GameState(_FIELD_ROWS, _FIELD_COLS)
-        self._game_tick = _GAME_SPEED
+# indexed by jewel state
+_BORDERS = [_FROZEN_BORDER, _FALLING_BORDER, _LANDED_BORDER, _MATCHED_BORDER]
 
+# drawn around the game the keys control, when there are several
+_FOCUS_BORDER = BorderStyle(pygame.Color(240, 200, 24), 3)
 
-    def run(self) -> None:
-        pygame.init()
 
-        try:
-            clock = pygame.time.Clock()
-
-            self._jewel_images = []
-            for img in JEWEL_IMAGES:
-                self._jewel_images.append(
-                    pygame.image.load(img + '.png')
-                    )
+class GameBoard:
+    '''One game in the window: its state, its timer, the part of its
+    field in view and a cached surface of the field, which is only
+    drawn again after one of its cells changed'''
+    def __init__(self, rows: int, cols: int, match_length: int):
+        self._state = columns.GameState(rows, cols, match_length)
+        self._game_tick = _GAME_SPEED
+        self._game_over = False
 
-            self._create_display((_INITIAL_WIDTH, _INITIAL_HEIGHT))
+        # top left cell and size of the part of the field being shown
+        self._view_row = 0
+        self._view_col = 0
+        self._view_rows = rows
+        self._view_cols = cols
 
-            while self._running:
-                clock.tick(_FRAME_RATE)
+        self._surface = None
+        self._dirty = True
+        self._state.subscribe(self._handle_changes)
 
-                self._redraw()
 
-                try:
-                    self._update()
-                except columns.GameOver:
-                    self._end_game()
-                
+    def state(self) -> columns.GameState:
+        return self._state
 
-        finally:
-            pygame.quit()
 
+    def game_over(self) -> bool:
+        return self._game_over
 
-    def _update(self) -> None:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self._end_game()
-                self._end_program()
-            if event.type == pygame.KEYDOWN:
-                if not self._game_over:
-                    self._handle_keys()
 
+    def update(self) -> None:
+        '''Runs one frame of the game'''
         if not self._game_over:
-            self._handle_time()
-            self._handle_faller_creation()
+            try:
+                self._handle_time()
+                self._handle_faller_creation()
+            except columns.GameOver:
+                self._end_game()
+        self._state.flush_changes()
 
 
     def _handle_time(self) -> None:
@@ -91,7 +98,7 @@ class ColumnsGame:
 
 
     def _handle_faller_creation(self) -> None:
-        if self._state.get_faller_position() == None:
+        if self._state.faller_row() == None:
             if not self._state.match_exists():
                 self._state.update_faller()
                 
@@ -113,26 +120,179 @@ class ColumnsGame:
                 self._state.drop_faller(random_col + 1)
 
 
-    def _handle_keys(self) -> None:
-        keys = pygame.key.get_pressed()
+    def handle_keys(self, keys) -> None:
+        # finished games can still be scrolled,
+        # each key press moves the view by half of it
+        page_rows = max(1, self._view_rows // 2)
+        page_cols = max(1, self._view_cols // 2)
+        if keys[pygame.K_w]:
+            self.scroll(-page_rows, 0)
+        if keys[pygame.K_s]:
+            self.scroll(page_rows, 0)
+        if keys[pygame.K_a]:
+            self.scroll(0, -page_cols)
+        if keys[pygame.K_d]:
+            self.scroll(0, page_cols)
 
-        if keys[pygame.K_SPACE]:
-            if self._state.get_faller_position() != None:
-                self._state.rotate_faller()
-        if keys[pygame.K_LEFT]:
-            if self._state.get_faller_position() != None:
-                self._state.move_faller_column(-1)
-        if keys[pygame.K_RIGHT]:
-            if self._state.get_faller_position() != None:
-                self._state.move_faller_column(1)
+        if self._game_over:
+            return
+
+        try:
+            if keys[pygame.K_SPACE]:
+                if self._state.faller_row() != None:
+                    self._state.rotate_faller()
+            if keys[pygame.K_LEFT]:
+                if self._state.faller_row() != None:
+                    self._state.move_faller_column(-1)
+            if keys[pygame.K_RIGHT]:
+                if self._state.faller_row() != None:
+                    self._state.move_faller_column(1)
+
+            if keys[pygame.K_DOWN]:
+                self._state.handle_time()
+        except columns.GameOver:
+            self._end_game()
+
+
+    def scroll(self, rows: int, cols: int) -> None:
+        self._view_row += rows
+        self._view_col += cols
+        self._dirty = True
+
+
+    def view(self) -> (int, int):
+        return self._view_row, self._view_col
+
+
+    def set_view(self, row: int, col: int, rows: int, cols: int) -> None:
+        self._view_row = row
+        self._view_col = col
+        self._view_rows = rows
+        self._view_cols = cols
+
+
+    def _handle_changes(self, changes: list[columns.CellChange]) -> None:
+        if len(changes) > 0:
+            self._dirty = True
 
-        if keys[pygame.K_DOWN]:
-            self._state.handle_time()
-            
 
     def _end_game(self) -> None:
         self._game_over = True
+        self._dirty = True
+
+
+    def cached_surface(self, size: (int, int)) -> pygame.Surface:
+        '''Returns the cached surface if it is still up to date
+        for size, otherwise None'''
+        if (self._dirty or self._surface is None
+            or self._surface.get_size() != size):
+            return None
+        return self._surface
+
+
+    def new_surface(self, size: (int, int)) -> pygame.Surface:
+        '''Returns the surface to draw the field on, which is then
+        cached until the field changes'''
+        if self._surface is None or self._surface.get_size() != size:
+            self._surface = pygame.Surface(size)
+        self._dirty = False
+        return self._surface
+
+
+
+class ColumnsGame:
+    def __init__(self, rows: int = _FIELD_ROWS, cols: int = _FIELD_COLS,
+                 match_length: int = columns.MIN_MATCH_LENGTH,
+                 games: int = 1):
+        if type(games) != int or games < 1:
+            raise columns.GameRuleError('There must be at least one game')
+
+        self._running = True
+        self._rows = rows
+        self._cols = cols
 
+        self._boards = []
+        for n in range(games):
+            self._boards.append(GameBoard(rows, cols, match_length))
+        # board controlled by the keys, Tab moves to the next one
+        self._focus = 0
+
+        # games laid out in a grid, as square as possible
+        self._grid_cols = math.ceil(math.sqrt(games))
+        self._grid_rows = math.ceil(games / self._grid_cols)
+
+        # loaded on their own thread once the window is open,
+        # None until then
+        self._jewel_images = None
+        # error raised while loading them, re-raised on the main thread
+        self._image_error = None
+        # whether the cached board surfaces were drawn with the images
+        self._drawn_with_images = False
+
+        # jewel images scaled to the current cell length
+        self._scaled_images = []
+        self._scaled_length = None
+
+        # fonts by size, loaded the first time they are needed
+        self._fonts = {}
+
+
+    def run(self) -> None:
+        # only the display, audio and joysticks are never used
+        pygame.display.init()
+
+        try:
+            clock = pygame.time.Clock()
+
+            board_height = min(_INITIAL_WIDTH * self._rows / self._cols,
+                               _MAX_INITIAL_HEIGHT)
+            max_width, max_height = _MAX_INITIAL_SIZE
+            self._create_display(
+                (min(_INITIAL_WIDTH * self._grid_cols, max_width),
+                 min(board_height * self._grid_rows, max_height)))
+
+            # the first frames are drawn without jewels until they load
+            threading.Thread(target = self._load_images, daemon = True).start()
+
+            while self._running:
+                clock.tick(_FRAME_RATE)
+
+                self._redraw()
+                self._update()
+                
+
+        finally:
+            pygame.quit()
+
+
+    def _load_images(self) -> None:
+        try:
+            jewel_images = []
+            for img in JEWEL_IMAGES:
+                jewel_images.append(
+                    pygame.image.load(img + '.png')
+                    )
+            self._jewel_images = jewel_images
+        except Exception as e:
+            self._image_error = e
+
+
+    def _update(self) -> None:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self._end_program()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_TAB:
+                    self._focus = (self._focus + 1) % len(self._boards)
+                else:
+                    self._boards[self._focus].handle_keys(
+                        pygame.key.get_pressed())
+
+        # one after the other: updates are short pure Python work,
+        # which threads would not run in parallel anyway
+        for board in self._boards:
+            board.update()
+            
 
     def _end_program(self) -> None:
         self._running = False
@@ -140,9 +300,7 @@ class ColumnsGame:
 
     def _redraw(self) -> None:
         self._draw_background()
-        self._draw_field()
-        if self._game_over:
-            self._draw_game_over()
+        self._draw_boards()
         pygame.display.flip()
 
 
@@ -151,50 +309,91 @@ class ColumnsGame:
         surface.fill(_BACKGROUND_COLOR)
 
 
-    def _draw_field(self) -> None:
-        field = self._state.field()
-        
+    def _draw_boards(self) -> None:
+        '''Draws every board that changed onto its own surface,
+        then copies all of them onto the window'''
         surface = pygame.display.get_surface()
+        board_width = surface.get_width() // self._grid_cols
+        board_height = surface.get_height() // self._grid_rows
+        board_size = (board_width, board_height)
+
+        # boards drawn before the images loaded are missing their jewels
+        if self._image_error is not None:
+            # a missing image stops the game, as loading it here would
+            raise self._image_error
+
+        images_loaded = self._jewel_images is not None
+        redraw_all = images_loaded != self._drawn_with_images
+        self._drawn_with_images = images_loaded
+
+        for index, board in enumerate(self._boards):
+            board_surface = None
+            if not redraw_all:
+                board_surface = board.cached_surface(board_size)
+            if board_surface is None:
+                board_surface = board.new_surface(board_size)
+                board_surface.fill(_BACKGROUND_COLOR)
+                self._draw_field(board, board_surface)
+                if board.game_over():
+                    self._draw_game_over(board_surface)
+
+            topleft = (board_width * (index % self._grid_cols),
+                       board_height * (index // self._grid_cols))
+            surface.blit(board_surface, topleft)
+
+            if len(self._boards) > 1 and index == self._focus:
+                border_color, thickness = _FOCUS_BORDER
+                pygame.draw.rect(surface, border_color,
+                                 pygame.Rect(topleft, board_size),
+                                 thickness)
+
+
+    def _draw_field(self, board: GameBoard,
+                    surface: pygame.Surface) -> None:
+        field = board.state().field()
+        
         surface_width = surface.get_width()
         surface_height = surface.get_height()
 
-        cell_length = surface_width / _FIELD_COLS
-
-        if cell_length * _FIELD_ROWS > surface_height:
-            cell_length = surface_height / _FIELD_ROWS
-
-
-        center_offset_x = (surface_width - (cell_length * _FIELD_COLS)) / 2
-        center_offset_y = (surface_height - (cell_length * _FIELD_ROWS)) / 2
-                
-
-        for i in range(field.visible_rows()):
-            for j in range(field.cols()):   
-                topleft_pixel_x = cell_length * j + center_offset_x
-                topleft_pixel_y = cell_length * i + center_offset_y
-
+        cell_length = surface_width / self._cols
+
+        if cell_length * self._rows > surface_height:
+            cell_length = surface_height / self._rows
+
+        # field too big for the window, only draw the part in view
+        view_rows = self._rows
+        view_cols = self._cols
+        if cell_length < _MIN_CELL_LENGTH:
+            cell_length = _MIN_CELL_LENGTH
+            view_rows = min(self._rows, int(surface_height // cell_length))
+            view_cols = min(self._cols, int(surface_width // cell_length))
+
+        view_row, view_col = board.view()
+        view_row = max(0, min(view_row, self._rows - view_rows))
+        view_col = max(0, min(view_col, self._cols - view_cols))
+        board.set_view(view_row, view_col, view_rows, view_cols)
+
+        center_offset_x = (surface_width - (cell_length * view_cols)) / 2
+        center_offset_y = (surface_height - (cell_length * view_rows)) / 2
+
+        scaled_images = self._get_scaled_images(cell_length)
+        visible_cells = field.visible_cells()
+
+        for i in range(view_row, view_row + view_rows):
+            row = visible_cells[i]
+            for j in range(view_col, view_col + view_cols):
+                topleft_pixel_x = (cell_length * (j - view_col)
+                                   + center_offset_x)
+                topleft_pixel_y = (cell_length * (i - view_row)
+                                   + center_offset_y)
                 offset = 15 * ((j % 2 + i % 2) % 2)
 
                 cell_color = pygame.Color(2 + offset,
                                           3 + offset,
                                           15 + offset)
 
-                frozen_border = BorderStyle(pygame.Color(0, 0, 0), 1)
-                falling_border = BorderStyle(pygame.Color(24, 24, 240), 2)
-                landed_border = BorderStyle(pygame.Color(240, 24, 24), 3)
-                matched_border = BorderStyle(pygame.Color(24, 240, 24), 4)
-
-                border_color, thickness = frozen_border
-
-                pos = columns.Position(i, j)
-                jewel = field.get_cell(pos)
-
-                if jewel.state() == 1:
-                    border_color, thickness = falling_border
-                elif jewel.state() == 2:
-                    border_color, thickness = landed_border
-                elif jewel.state() == 3:
-                    border_color, thickness = matched_border
+                jewel = row[j]
+                border_color, thickness = _BORDERS[jewel.state()]
                 
                 # Cell Background Color
                 pygame.draw.rect(surface, cell_color,
@@ -216,21 +415,29 @@ class ColumnsGame:
                 )
 
                 # Jewel
-                if not field.is_empty_space(pos):
-                    jewel_rect = pygame.Rect(
-                        topleft_pixel_x, topleft_pixel_y,
-                        cell_length, cell_length)
-
-                    scaled_image = pygame.transform.scale(
-                        self._jewel_images[jewel.color() - 1],
-                        (cell_length, cell_length))
-
-                    surface.blit(scaled_image, jewel_rect)
+                if jewel.color() != 0 and scaled_images is not None:
+                    surface.blit(scaled_images[jewel.color() - 1],
+                                 (topleft_pixel_x, topleft_pixel_y))
+
+
+    def _get_scaled_images(self, cell_length: float) -> list[pygame.Surface]:
+        '''Returns the jewel images scaled to cell_length, only scaling
+        them again when the cell length changes.
+        Returns None while the images are still loading'''
+        if self._jewel_images is None:
+            return None
+
+        if cell_length != self._scaled_length:
+            self._scaled_images = []
+            for image in self._jewel_images:
+                self._scaled_images.append(pygame.transform.scale(
+                    image, (cell_length, cell_length)))
+            self._scaled_length = cell_length
+        return self._scaled_images
 
         
 
-    def _draw_game_over(self) -> None:
-        surface = pygame.display.get_surface()
+    def _draw_game_over(self, surface: pygame.Surface) -> None:
         surface_width = surface.get_width()
         surface_height = surface.get_height()
 
@@ -241,7 +448,7 @@ class ColumnsGame:
         if surface_width > surface_height:
             font_size = surface_height // 13
             
-        font = pygame.font.SysFont(None, font_size)
+        font = self._get_font(font_size)
         
         text_image = font.render(message, True, pygame.Color(255, 25, 25))
         text_rect = text_image.get_rect(
@@ -250,6 +457,16 @@ class ColumnsGame:
         surface.blit(text_image, text_rect)
 
 
+    def _get_font(self, size: int) -> pygame.font.Font:
+        '''Returns the default pygame font at size, which unlike SysFont
+        does not have to search the system fonts'''
+        if size not in self._fonts:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            self._fonts[size] = pygame.font.Font(None, size)
+        return self._fonts[size]
+
+
     def _create_display(self, size: (int, int)) -> None:
         pygame.display.set_mode(size, pygame.RESIZABLE)
 
@@ -257,4 +474,12 @@ class ColumnsGame:
 
 
 if __name__ == '__main__':
-    ColumnsGame().run()
+    parser = argparse.ArgumentParser(description = 'Columns Game')
+    parser.add_argument('--rows', type = int, default = _FIELD_ROWS)
+    parser.add_argument('--cols', type = int, default = _FIELD_COLS)
+    parser.add_argument('--match-length', type = int,
+                        default = columns.MIN_MATCH_LENGTH)
+    parser.add_argument('--games', type = int, default = 1)
+    args = parser.parse_args()
+
+    ColumnsGame(args.rows, args.cols, args.match_length, args.games).run()
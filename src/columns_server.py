@@ -0,0 +1,251 @@
+# Columns asyncio server
+# Hosts many GameState sessions in one process.
+#
+# Protocol (one JSON object per line, over a local TCP socket):
+#   client -> server: {"command": "rotate" | "left" | "right" | "down"}
+#   server -> client: {"type": "cells", "cells": [[row, col, color, state], ...]}
+#                     {"type": "score", "score": n, "chain": n}
+#                     {"type": "game_over"}
+#                     {"type": "error", "message": "..."}
+# The first "cells" message holds the whole visible field,
+# every later one only holds the cells that changed.
+
+import asyncio
+import json
+import random
+import sys
+
+import columns
+
+
+_FRAME_RATE = 30
+_GAME_SPEED = 30
+
+_FIELD_ROWS = 13
+_FIELD_COLS = 6
+
+_HOST = '127.0.0.1'
+_PORT = 8765
+
+# clients with more than this many bytes not yet sent to them are
+# not keeping up, and get disconnected
+_MAX_WRITE_BUFFER = 1024 * 1024
+
+
+class GameSession:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self._writer = writer
+        self._state = columns.GameState(_FIELD_ROWS, _FIELD_COLS)
+        self._game_over = False
+        self._sent_score = 0
+        self._state.subscribe(self._send_cells)
+
+
+    def game_over(self) -> bool:
+        return self._game_over
+
+
+    def closed(self) -> bool:
+        return self._writer.is_closing()
+
+
+    def close(self, message: str = None) -> None:
+        '''Ends the session, telling the client why if there is a message'''
+        if message is not None:
+            self.send({'type': 'error', 'message': message})
+        self._writer.close()
+
+
+    def handle_time(self) -> None:
+        if self._game_over:
+            return
+        try:
+            self._state.handle_time()
+            self._handle_faller_creation()
+        except columns.GameOver:
+            self._end_game()
+        self.send_changes()
+
+
+    def handle_command(self, command: str) -> None:
+        if self._game_over:
+            return
+
+        try:
+            if command == 'down':
+                self._state.handle_time()
+                self._handle_faller_creation()
+            elif self._state.faller_row() != None:
+                if command == 'rotate':
+                    self._state.rotate_faller()
+                elif command == 'left':
+                    self._state.move_faller_column(-1)
+                elif command == 'right':
+                    self._state.move_faller_column(1)
+                else:
+                    self.send({'type': 'error',
+                               'message': 'Unknown command'})
+                    return
+        except columns.GameOver:
+            self._end_game()
+        self.send_changes()
+
+
+    def _handle_faller_creation(self) -> None:
+        if self._state.faller_row() == None:
+            if not self._state.match_exists():
+                self._state.update_faller()
+
+                field = self._state.field()
+                available_cols = []
+                for col in range(field.cols()):
+                    if field.is_empty_space(columns.Position(0, col)):
+                        available_cols.append(col)
+
+                if len(available_cols) == 0:
+                    self._end_game()
+                    return
+
+                random_col = random.choice(available_cols)
+                self._state.drop_faller(random_col + 1)
+
+
+    def _end_game(self) -> None:
+        self._game_over = True
+        self.send_changes()
+        self.send({'type': 'game_over'})
+
+
+    def send_board(self) -> None:
+        '''Sends every visible cell'''
+        cells = []
+        for i, row in enumerate(self._state.field().visible_cells()):
+            for j, jewel in enumerate(row):
+                cells.append([i, j, jewel.color(), jewel.state()])
+        self.send({'type': 'cells', 'cells': cells})
+
+
+    def send_changes(self) -> None:
+        '''Sends the cells that changed since the last update,
+        and the score if it changed'''
+        self._state.flush_changes()
+
+        score = self._state.score()
+        if score != self._sent_score:
+            self._sent_score = score
+            self.send({'type': 'score', 'score': score,
+                       'chain': self._state.chain()})
+
+
+    def _send_cells(self, changes: list[columns.CellChange]) -> None:
+        cells = []
+        for change in changes:
+            # the invisible rows above the field are not sent
+            if change.position.row >= 0:
+                cells.append([change.position.row, change.position.col,
+                              change.new_color, change.new_state])
+        if len(cells) > 0:
+            self.send({'type': 'cells', 'cells': cells})
+
+
+    def send(self, message: dict) -> None:
+        if self._writer.is_closing():
+            return
+        if (self._writer.transport.get_write_buffer_size()
+            > _MAX_WRITE_BUFFER):
+            # client stopped reading, drop it
+            self._writer.close()
+            return
+        self._writer.write(json.dumps(message).encode() + b'\n')
+
+
+
+class TimerWheel:
+    '''Schedules every session on one timer instead of one clock per game.
+    Each frame advances the wheel by one slot and ticks the sessions
+    in that slot, which are then rescheduled a full turn later'''
+    def __init__(self, slots: int = _GAME_SPEED):
+        self._slots = [set() for n in range(slots)]
+        self._current = 0
+
+
+    def add(self, session: GameSession) -> None:
+        # lands one full turn from now, so new games get the usual delay
+        self._slots[(self._current - 1) % len(self._slots)].add(session)
+
+
+    def remove(self, session: GameSession) -> None:
+        for slot in self._slots:
+            slot.discard(session)
+
+
+    def advance(self) -> None:
+        self._current = (self._current + 1) % len(self._slots)
+        slot = self._slots[self._current]
+        for session in list(slot):
+            try:
+                session.handle_time()
+            except Exception:
+                # only this session ends, the others keep ticking
+                session.close('Internal error')
+            if session.game_over() or session.closed():
+                slot.discard(session)
+
+
+    async def run(self, frame_rate: int = _FRAME_RATE) -> None:
+        loop = asyncio.get_running_loop()
+        frame = 1 / frame_rate
+        next_frame = loop.time()
+        while True:
+            self.advance()
+            next_frame += frame
+            await asyncio.sleep(max(0, next_frame - loop.time()))
+
+
+
+class ColumnsServer:
+    def __init__(self):
+        self._wheel = TimerWheel()
+
+
+    async def serve(self, host: str = _HOST, port: int = _PORT) -> None:
+        server = await asyncio.start_server(self._handle_client, host, port)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self._wheel.run())
+
+
+    async def _handle_client(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter) -> None:
+        session = GameSession(writer)
+        session.send_board()
+        self._wheel.add(session)
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # line longer than the reader's limit
+                    session.close('Message too long')
+                    break
+                if not line:
+                    break
+                try:
+                    command = json.loads(line)['command']
+                except (ValueError, KeyError, TypeError):
+                    session.send({'type': 'error',
+                                  'message': 'Invalid message'})
+                    continue
+                session.handle_command(command)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._wheel.remove(session)
+            writer.close()
+
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else _PORT
+    asyncio.run(ColumnsServer().serve(port = port))
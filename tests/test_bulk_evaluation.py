@@ -0,0 +1,118 @@
+# Tests for the bulk board evaluation in columns
+
+import os
+import random
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import columns
+
+
+def _random_boards(rng: random.Random, count: int,
+                   rows: int, cols: int) -> bytes:
+    board_bytes = bytearray()
+    for n in range(count * rows * cols):
+        if rng.random() < 0.8:
+            board_bytes.append(rng.randint(1, columns.TOTAL_COLORS - 1))
+        else:
+            board_bytes.append(0)
+    return bytes(board_bytes)
+
+
+def _evaluate_with_game_state(boards: bytes, rows: int, cols: int,
+                              match_length: int) -> list[(list[int], int)]:
+    '''Evaluates every board through GameState, the reference for
+    the packed evaluation'''
+    results = []
+    board_size = rows * cols
+    for offset in range(0, len(boards), board_size):
+        board = boards[offset:offset + board_size]
+        contents = []
+        for i in range(rows):
+            contents.append(list(board[i * cols:(i + 1) * cols]))
+
+        state = columns.GameState(rows, cols, match_length)
+        state.fill_field(contents)
+        cascades = state.resolve_cascades()
+        results.append((cascades, state.score()))
+    return results
+
+
+def _write_npy(path: str, boards: bytes, rows: int, cols: int) -> None:
+    count = len(boards) // (rows * cols)
+    header = ("{'descr': '|u1', 'fortran_order': False, 'shape': (%d, %d, %d), }"
+              % (count, rows, cols))
+    # header is padded so the data starts at a multiple of 64
+    header += ' ' * (63 - (10 + len(header)) % 64) + '\n'
+    with open(path, 'wb') as file:
+        file.write(b'\x93NUMPY\x01\x00')
+        file.write(struct.pack('<H', len(header)))
+        file.write(header.encode('latin1'))
+        file.write(boards)
+
+
+def test_packed_boards_match_game_state(tmp_path):
+    rng = random.Random(26)
+    for n in range(200):
+        rows = rng.randint(columns.MIN_ROWS, 12)
+        cols = rng.randint(columns.MIN_COLS, 9)
+        match_length = rng.randint(2, 4)
+        boards = _random_boards(rng, 5, rows, cols)
+
+        path = tmp_path / 'boards.bin'
+        path.write_bytes(boards)
+
+        results = []
+        for result in columns.evaluate_boards(str(path), rows, cols,
+                                              match_length):
+            results.append((result.cascades, result.score))
+
+        assert results == _evaluate_with_game_state(
+            boards, rows, cols, match_length), (rows, cols, match_length)
+
+
+def test_npy_boards_match_packed_boards(tmp_path):
+    rng = random.Random(33)
+    boards = _random_boards(rng, 50, 13, 6)
+    packed_path = tmp_path / 'boards.bin'
+    packed_path.write_bytes(boards)
+    npy_path = tmp_path / 'boards.npy'
+    _write_npy(str(npy_path), boards, 13, 6)
+
+    npy_results = list(columns.evaluate_boards(str(npy_path)))
+    assert len(npy_results) == 50
+    assert npy_results == list(
+        columns.evaluate_boards(str(packed_path), 13, 6))
+
+
+def test_empty_file_has_no_boards(tmp_path):
+    path = tmp_path / 'empty.bin'
+    path.write_bytes(b'')
+    assert list(columns.evaluate_boards(str(path), 13, 6)) == []
+
+
+def test_invalid_input_raises_game_rule_error(tmp_path):
+    path = tmp_path / 'boards.bin'
+    path.write_bytes(bytes(13 * 6))
+    with pytest.raises(columns.GameRuleError):
+        list(columns.evaluate_boards(str(path), 13.0, 6))
+    with pytest.raises(columns.GameRuleError):
+        list(columns.evaluate_boards(str(path), 12, 6))
+
+    path.write_bytes(bytes([columns.TOTAL_COLORS]) + bytes(13 * 6 - 1))
+    with pytest.raises(columns.GameRuleError):
+        list(columns.evaluate_boards(str(path), 13, 6))
+
+
+def test_malformed_npy_header_raises_game_rule_error(tmp_path):
+    path = tmp_path / 'boards.npy'
+    for contents in [b'\x93NUMPY',
+                     b'\x93NUMPY\x01\x00\x10\x00{not a header',
+                     b"\x93NUMPY\x01\x00\x0c\x00{'shape': 1}"]:
+        path.write_bytes(contents)
+        with pytest.raises(columns.GameRuleError):
+            list(columns.evaluate_boards(str(path)))